@@ -1,54 +1,132 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException    
-from fastapi.responses import FileResponse    
-from ..core.logger import get_logger    
-from ..core.config import ensure_dirs, UPLOADS_DIR, OUTPUTS_DIR, FILTERS_DIR  
-from ..services.file_handler import save_upload    
-from ..services.marker_runner import run_marker_for_chunk    
+from fastapi import APIRouter, Request, UploadFile, File, HTTPException
+from fastapi.responses import FileResponse, Response
+from ..core.logger import get_logger
+from ..core.config import UPLOADS_DIR, OUTPUTS_DIR, FILTERS_DIR, MAX_CONCURRENT_UPLOADS
+from ..services.file_handler import save_upload
+from ..services.marker_runner import run_marker_for_chunk
 from ..services.pdf_converter import convert_pdf_and_process
-from ..models.schemas import UploadResponse, TableExtractionResponse    
-from ..core.exceptions import InvalidFileError, MarkerError  # Removed ChunkingError  
+from ..models.schemas import UploadResponse, TableExtractionResponse
+from ..core.exceptions import InvalidFileError, MarkerError  # Removed ChunkingError
 from pathlib import Path
-import time    
-    
-router = APIRouter()    
-logger = get_logger(__name__)    
-    
-    
-@router.post("/upload", response_model=UploadResponse)    
-async def upload_pdf(file: UploadFile = File(...)):    
+from typing import Dict
+import asyncio
+import functools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+router = APIRouter()
+logger = get_logger(__name__)
+
+# Map doc_name -> markdown path so /download resolves without probing the
+# filesystem; persisted so the index survives restarts
+_INDEX_FILE = OUTPUTS_DIR / ".index.json"
+
+
+def _load_doc_index() -> Dict[str, Path]:
+    try:
+        raw = json.loads(_INDEX_FILE.read_text(encoding="utf-8"))
+        return {name: Path(p) for name, p in raw.items()}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Could not load document index, starting empty: {e}")
+        return {}
+
+
+_doc_index: Dict[str, Path] = _load_doc_index()
+
+
+def _serve_file(path: Path, request: Request, media_type: str) -> Response:
+    """Return a FileResponse with an ETag, or 304 when the client's copy is current.
+
+    The ETag is derived from mtime and size, so unchanged files cost one stat
+    instead of a full re-transfer on repeat downloads.
+    """
+    st = path.stat()
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return FileResponse(
+        path,
+        filename=path.name,
+        media_type=media_type,
+        headers={"ETag": etag, "Cache-Control": "private, max-age=60"},
+    )
+
+
+def _remember_doc(doc_name: str, md_path: Path):
+    """Record where a document's markdown lives and persist the index."""
+    _doc_index[doc_name] = md_path
+    try:
+        _INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+        _INDEX_FILE.write_text(
+            json.dumps({name: str(p) for name, p in _doc_index.items()}),
+            encoding="utf-8",
+        )
+    except Exception as e:
+        logger.warning(f"Could not persist document index: {e}")
+
+# Bound concurrent uploads so parallel per-page marker runs don't oversubscribe the GPU(s)
+_upload_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+
+# Marker processing is synchronous and slow; run it here so the event loop
+# keeps serving other requests. Threads (not processes) because the marker
+# models live in this process and must not be reloaded per worker.
+_processing_executor = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_UPLOADS, thread_name_prefix="marker-upload"
+)
+
+
+@router.post("/upload", response_model=UploadResponse)
+async def upload_pdf(file: UploadFile = File(...)):
     """Upload a PDF or image and process it with marker.
-    
+
     For PDFs: Converts to images, processes each page with marker_single, combines output.
     For images: Processes directly with marker_single.
     """
-    ensure_dirs()    
-    start = time.time()    
-    try:    
-        saved_path = await save_upload(file)    
+    start = time.time()
+    try:
+        saved_path = await save_upload(file)
         logger.info(f"Saved upload to {saved_path}")
-        
+
         # Check file type
         file_suffix = saved_path.suffix.lower()
-        
-        if file_suffix == ".pdf":
-            # Use PDF converter workflow for PDFs
-            logger.info(f"PDF detected, using conversion workflow: {saved_path}")
-            output = convert_pdf_and_process(saved_path, output_dir=OUTPUTS_DIR, keep_images=False)
-        else:
-            # Direct processing for images - organize by filename in outputs
-            logger.info(f"Image detected, processing directly with marker_single: {saved_path}")
-            # Create a directory for this image's output (similar to PDF structure)
-            img_output_dir = OUTPUTS_DIR / saved_path.stem
-            img_output_dir.mkdir(parents=True, exist_ok=True)
-            output = run_marker_for_chunk(saved_path, output_dir=img_output_dir)
-        
-        logger.info(f"Processing produced output file: {output}")    
+
+        loop = asyncio.get_running_loop()
+        async with _upload_semaphore:
+            if file_suffix == ".pdf":
+                # Use PDF converter workflow for PDFs
+                logger.info(f"PDF detected, using conversion workflow: {saved_path}")
+                output = await loop.run_in_executor(
+                    _processing_executor,
+                    functools.partial(
+                        convert_pdf_and_process, saved_path, output_dir=OUTPUTS_DIR, keep_images=False
+                    ),
+                )
+            else:
+                # Direct processing for images - organize by filename in outputs
+                logger.info(f"Image detected, processing directly with marker_single: {saved_path}")
+                # Create a directory for this image's output (similar to PDF structure)
+                img_output_dir = OUTPUTS_DIR / saved_path.stem
+                img_output_dir.mkdir(parents=True, exist_ok=True)
+                output = await loop.run_in_executor(
+                    _processing_executor,
+                    functools.partial(run_marker_for_chunk, saved_path, output_dir=img_output_dir),
+                )
+
+        logger.info(f"Processing produced output file: {output}")
+
+        # The fresh output may shadow tables memoized from a previous version
+        from ..services.table_extractor import clear_table_cache
+        clear_table_cache()
     
         elapsed = time.time() - start    
         
         # Extract document name for download endpoint
         doc_name = Path(output).stem
-        
+        _remember_doc(doc_name, Path(output))
+
         return UploadResponse(    
             status="success",    
             filename=saved_path.name,    
@@ -67,13 +145,13 @@ async def upload_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
     
 # @router.get("/download/{filename:path}")    
-# def download(filename: str):    
+# def download(filename: str, request: Request):    
 #     path = OUTPUTS_DIR / filename  
 #     if not path.exists():    
 #         raise HTTPException(status_code=404, detail="File not found")    
 #     return FileResponse(path, filename=path.name, media_type="text/markdown")
 @router.get("/download/{filename:path}")    
-def download(filename: str):    
+def download(filename: str, request: Request):    
     """Download markdown file from processed documents.
     
     Handles both upload types:
@@ -95,25 +173,34 @@ def download(filename: str):
         doc_name = Path(filename).name
     
     logger.info(f"Extracted document name: {doc_name}")
-    
+
+    # Fast path: uploads register themselves in the document index
+    indexed_path = _doc_index.get(doc_name)
+    if indexed_path is not None and indexed_path.exists():
+        logger.info(f"Found markdown via document index: {indexed_path}")
+        return _serve_file(indexed_path, request, "text/markdown")
+
     # Strategy 1: PDF structure - outputs/CAM102025/CAM102025.md (root level in doc folder)
     pdf_path = OUTPUTS_DIR / doc_name / f"{doc_name}.md"
     if pdf_path.exists():
         logger.info(f"Found markdown at PDF path: {pdf_path}")
-        return FileResponse(pdf_path, filename=pdf_path.name, media_type="text/markdown")
-    
+        _remember_doc(doc_name, pdf_path)
+        return _serve_file(pdf_path, request, "text/markdown")
+
     # Strategy 2: Image structure - outputs/Screenshot.../Screenshot.../Screenshot....md (deeply nested)
     image_path = OUTPUTS_DIR / doc_name / doc_name / f"{doc_name}.md"
     if image_path.exists():
         logger.info(f"Found markdown at image path: {image_path}")
-        return FileResponse(image_path, filename=image_path.name, media_type="text/markdown")
-    
+        _remember_doc(doc_name, image_path)
+        return _serve_file(image_path, request, "text/markdown")
+
     # Strategy 3: Direct file in outputs/ (legacy structure)
     direct_path = OUTPUTS_DIR / f"{doc_name}.md"
     if direct_path.exists():
         logger.info(f"Found markdown at direct path: {direct_path}")
-        return FileResponse(direct_path, filename=direct_path.name, media_type="text/markdown")
-    
+        _remember_doc(doc_name, direct_path)
+        return _serve_file(direct_path, request, "text/markdown")
+
     # Log available directories for debugging
     logger.warning(f"Markdown file not found for document: {doc_name}")
     try:
@@ -133,7 +220,6 @@ async def filter_tables(document: str, store_in_filters: bool = False):
     Expects marker output folder structure: outputs/<document>/<document>.md
     Returns metadata including created CSV files.
     """
-    ensure_dirs()
     start = time.time()
     try:
         from ..services.table_extractor import extract_and_save_tables
@@ -160,7 +246,7 @@ async def filter_tables(document: str, store_in_filters: bool = False):
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.get("/download_table")
-def download_table(document: str, filename: str, store_in_filters: bool = False):
+def download_table(document: str, filename: str, request: Request, store_in_filters: bool = False):
     """Download a generated CSV table file for a document.
 
     Parameters:
@@ -171,7 +257,6 @@ def download_table(document: str, filename: str, store_in_filters: bool = False)
 
     Returns the CSV file or 404 if not found. Rejects path traversal attempts.
     """
-    ensure_dirs()
     # Basic traversal protection
     if any(ch in filename for ch in ("..", "/", "\\")):
         raise HTTPException(status_code=400, detail="Invalid filename")
@@ -186,8 +271,4 @@ def download_table(document: str, filename: str, store_in_filters: bool = False)
         raise HTTPException(status_code=404, detail="CSV file not found")
 
     logger.info(f"Downloading CSV table file {path}")
-    return FileResponse(
-        path,
-        filename=path.name,
-        media_type="text/csv",
-    )
+    return _serve_file(path, request, "text/csv")
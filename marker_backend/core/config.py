@@ -14,6 +14,10 @@ FILTERS_DIR = TEMP_DIR / "filters"
 PDF2IMAGE_DIR = TEMP_DIR / "pdf2image"
 LOGS_DIR = BASE_DIR / "logs"
 
+# Persistent cache of marker outputs keyed by input content hash
+CACHE_DIR = TEMP_DIR / ".marker_cache"
+MARKER_CACHE_MAX_GB = float(os.environ.get("MARKER_CACHE_MAX_GB", 5))
+
 # Marker CLI configuration
 # Set to the marker CLI/binary you have installed, e.g. "marker_single" or full path
 MARKER_CLI = os.environ.get("MARKER_CLI", "marker_single")
@@ -25,6 +29,17 @@ OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "markdown")
 # Logging
 LOG_FILE = LOGS_DIR / "app.log"
 
+# Parallelism for per-page Marker runs
+# Worker count defaults to min(cpu_count, GPU_count * slots); override with MARKER_MAX_WORKERS
+MARKER_SLOTS_PER_GPU = int(os.environ.get("MARKER_SLOTS_PER_GPU", 2))
+MARKER_MAX_WORKERS = int(os.environ.get("MARKER_MAX_WORKERS", 0))  # 0 = size automatically
+MAX_CONCURRENT_UPLOADS = int(os.environ.get("MAX_CONCURRENT_UPLOADS", 2))
+
+# Batching of queued chunks before dispatch: fire when the queue holds
+# MARKER_BATCH_SIZE chunks or MARKER_BATCH_WAIT_MS elapses, whichever first
+MARKER_BATCH_SIZE = int(os.environ.get("MARKER_BATCH_SIZE", 8))
+MARKER_BATCH_WAIT_MS = int(os.environ.get("MARKER_BATCH_WAIT_MS", 200))
+
 # GPU safety thresholds (degrees C and free memory in MB)
 GPU_TEMP_THRESHOLD_C = int(os.environ.get("GPU_TEMP_THRESHOLD_C", 85))
 GPU_MEM_FREE_MB = int(os.environ.get("GPU_MEM_FREE_MB", 500))
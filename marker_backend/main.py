@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 import uvicorn
 from .api.endpoints import router as api_router
@@ -5,10 +7,17 @@ from .core.config import ensure_dirs, HOST, PORT
 from .core.logger import get_logger
 from fastapi.middleware.cors import CORSMiddleware
 
-ensure_dirs()
 logger = get_logger(__name__)
 
-app = FastAPI(title="Marker Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the working directories once at startup instead of on every request
+    ensure_dirs()
+    yield
+
+
+app = FastAPI(title="Marker Backend", lifespan=lifespan)
 
 # Enable CORS so frontend can call API
 app.add_middleware(
@@ -1,13 +1,17 @@
 from fastapi import UploadFile
 from pathlib import Path
-import shutil
+import aiofiles
 from ..core.config import UPLOADS_DIR, ALLOWED_EXTENSIONS
 from ..core.exceptions import InvalidFileError
 
+# Copy uploads in 1MB chunks; large PDFs never sit fully in memory
+_UPLOAD_CHUNK_SIZE = 1 << 20
+
 
 async def save_upload(upload_file: UploadFile) -> Path:
     """Validate uploaded file is PDF or an allowed image type and save to UPLOADS_DIR.
-    Returns Path to saved file.
+    Streams the body to disk in chunks so large uploads neither buffer fully in
+    memory nor stall the event loop. Returns Path to saved file.
     """
     filename = upload_file.filename or "upload"
     suffix = Path(filename).suffix.lower()
@@ -21,9 +25,8 @@ async def save_upload(upload_file: UploadFile) -> Path:
     UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
     target = UPLOADS_DIR / filename
 
-    # Save streaming to disk
-    with target.open("wb") as buffer:
-        content = await upload_file.read()
-        buffer.write(content)
+    async with aiofiles.open(target, "wb") as out:
+        while chunk := await upload_file.read(_UPLOAD_CHUNK_SIZE):
+            await out.write(chunk)
 
     return target
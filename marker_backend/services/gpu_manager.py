@@ -22,5 +22,5 @@ def get_gpu_summary():
         if res.returncode == 0:
             return res.stdout.strip()
     except Exception as e:
-        logger.debug(f"Could not run nvidia-smi: {e}")
+        logger.debug("Could not run nvidia-smi: %s", e)
     return ""
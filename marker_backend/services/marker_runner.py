@@ -1,9 +1,20 @@
+import asyncio
+import hashlib
+import queue
+import shutil
 import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Tuple, Union
 from ..core.config import (
+    CACHE_DIR,
+    MARKER_BATCH_SIZE,
+    MARKER_BATCH_WAIT_MS,
+    MARKER_CACHE_MAX_GB,
     MARKER_CLI,
     MARKER_FLAGS,
+    MARKER_MAX_WORKERS,
+    MARKER_SLOTS_PER_GPU,
     OUTPUTS_DIR,
     OUTPUT_FORMAT,
     GPU_TEMP_THRESHOLD_C,
@@ -14,33 +25,196 @@ from ..core.config import (
 from ..core.logger import get_logger
 from ..core.exceptions import MarkerError
 import shlex
+import threading
 import time
 import os
 
 logger = get_logger(__name__)
 
+# Prefer marker's Python API so torch weights are loaded once per process
+# instead of being re-initialized by every marker_single subprocess.
+try:
+    from marker.converters.pdf import PdfConverter
+    from marker.models import create_model_dict
+    from marker.output import text_from_rendered
+    _HAVE_MARKER_API = True
+except ImportError:
+    _HAVE_MARKER_API = False
+
+# blake3's SIMD implementation hashes several GB/s vs ~500MB/s for sha256;
+# optional, with sha256 as the fallback
+try:
+    from blake3 import blake3 as _blake3
+    _HAVE_BLAKE3 = True
+except ImportError:
+    _HAVE_BLAKE3 = False
+
+_converter = None
+_converter_lock = threading.Lock()
+
+
+def _filter_output_dir_flags(flags: List[str]) -> Tuple[str, ...]:
+    """Drop any --output_dir flag (and its value); it is injected per run."""
+    filtered = []
+    skip_next = False
+    for flag in flags:
+        if skip_next:
+            skip_next = False
+            continue
+        if flag == "--output_dir":
+            skip_next = True
+            continue
+        filtered.append(flag)
+    return tuple(filtered)
+
+
+# Filtered once at import so per-chunk code doesn't re-walk the flag list
+MARKER_FLAGS_CLEAN = _filter_output_dir_flags(MARKER_FLAGS)
+
+
+def _flags_to_marker_config(flags: List[str]) -> dict:
+    """Translate CLI-style MARKER_FLAGS into a config dict for PdfConverter.
+
+    `--force_ocr --output_format markdown` -> {"force_ocr": True, "output_format": "markdown"}.
+    Flags without a value become booleans; `--output_dir` is dropped since we
+    write the markdown ourselves.
+    """
+    config = {}
+    i = 0
+    while i < len(flags):
+        flag = flags[i]
+        if not flag.startswith("--"):
+            i += 1
+            continue
+        key = flag[2:]
+        if i + 1 < len(flags) and not flags[i + 1].startswith("--"):
+            if key != "output_dir":
+                config[key] = flags[i + 1]
+            i += 2
+        else:
+            config[key] = True
+            i += 1
+    return config
+
+
+def _get_converter():
+    """Return the process-wide PdfConverter, loading marker models on first use.
+
+    Model loading costs several seconds and hundreds of MB; doing it once and
+    keeping the models resident removes that cost from every subsequent chunk.
+    """
+    global _converter
+    if _converter is None:
+        with _converter_lock:
+            if _converter is None:
+                logger.info("Loading marker models (one-time per-process cost)")
+                start = time.time()
+                models = create_model_dict()
+                _converter = PdfConverter(
+                    artifact_dict=models,
+                    config=_flags_to_marker_config(MARKER_FLAGS),
+                )
+                logger.info("Marker models loaded in %.2fs", time.time() - start)
+    return _converter
+
+
+def _cache_key(chunk_path: Path) -> str:
+    """Content hash over the input bytes plus the active MARKER_FLAGS.
+
+    Uses blake3 (SIMD, multi-core) when installed, sha256 otherwise; the two
+    produce disjoint keys, so switching hashers just re-populates the cache.
+    Flags are part of the key so changing e.g. --force_ocr invalidates old
+    entries. Reads in 4MB blocks to keep memory flat for large PDFs.
+    """
+    if _HAVE_BLAKE3:
+        h = _blake3(max_threads=_blake3.AUTO)
+    else:
+        h = hashlib.sha256()
+    with chunk_path.open("rb") as f:
+        while True:
+            block = f.read(1 << 22)
+            if not block:
+                break
+            h.update(block)
+    h.update(repr(MARKER_FLAGS).encode())
+    return h.hexdigest()
+
+
+def _store_in_cache(cache_key: str, md_path: Path, stem: str):
+    """Copy a finished markdown output into the content-hash cache."""
+    try:
+        entry_dir = CACHE_DIR / cache_key
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copy(md_path, entry_dir / f"{stem}.md")
+        ensure_cache_size_limit()
+    except Exception as e:
+        logger.warning("Could not cache marker output for key %s: %s", cache_key, e)
+
+
+def ensure_cache_size_limit(max_gb: float = MARKER_CACHE_MAX_GB):
+    """Evict least-recently-used cache entries until the cache fits in max_gb."""
+    try:
+        entries = []
+        total = 0
+        for entry in CACHE_DIR.iterdir():
+            if not entry.is_dir():
+                continue
+            size = sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+            entries.append((entry.stat().st_mtime, size, entry))
+            total += size
+
+        limit = int(max_gb * 1024 ** 3)
+        if total <= limit:
+            return
+
+        entries.sort(key=lambda t: t[0])  # oldest first
+        for _mtime, size, entry in entries:
+            if total <= limit:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            logger.info("Evicted marker cache entry %s", entry.name)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.debug("Cache eviction skipped: %s", e)
+
 
 def run_marker_for_chunk(chunk_path: Path, output_dir: Path = None) -> Path:
     """Run marker on a chunk (image or PDF) and return path to markdown output.
-    
+
+    Results are cached under CACHE_DIR keyed by content hash, so re-uploading
+    identical files returns without re-running marker.
+
+    Uses marker's in-process Python API when the `marker` package is importable
+    (models stay resident between chunks); otherwise falls back to shelling out
+    to the marker_single CLI.
+
     Args:
         chunk_path: Path to the input file (image or PDF)
-        output_dir: Directory where marker should save outputs. 
+        output_dir: Directory where marker should save outputs.
                    If None, uses MARKER_OUTPUT_DIR from config.
-    
+
     Returns:
         Path to the extracted markdown file
-    
+
     Raises:
         MarkerError: If marker processing fails
     """
     if output_dir is None:
         output_dir = OUTPUTS_DIR
-    
+
     out_path = output_dir / f"{chunk_path.stem}.md"
 
-    # If CUDA_VISIBLE_DEVICES is set in env, respect it; otherwise use system default
-    env = os.environ.copy()
+    # Repeat uploads of identical content skip marker entirely
+    cache_key = _cache_key(chunk_path)
+    cached = CACHE_DIR / cache_key / f"{chunk_path.stem}.md"
+    if cached.exists():
+        logger.info("Marker cache hit for %s (key=%s)", chunk_path, cache_key[:12])
+        os.utime(cached.parent)  # refresh LRU position
+        output_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copy(cached, out_path)
+        return out_path
 
     # Wait for GPU to be in a safe state before launching heavy processing
     try:
@@ -49,22 +223,38 @@ def run_marker_for_chunk(chunk_path: Path, output_dir: Path = None) -> Path:
         # re-raise to stop processing
         raise
 
+    if _HAVE_MARKER_API:
+        converter = _get_converter()
+        logger.info("Running in-process marker for %s", chunk_path)
+        start = time.time()
+        try:
+            rendered = converter(str(chunk_path))
+            text, _, _images = text_from_rendered(rendered)
+        except Exception as e:
+            logger.error("In-process marker failed for %s: %s", chunk_path, e)
+            raise MarkerError(f"Marker failed for {chunk_path}: {e}")
+        logger.info("Marker finished for %s in %.2fs", chunk_path, time.time() - start)
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with out_path.open("w", encoding="utf-8") as f:
+            f.write(text)
+        _store_in_cache(cache_key, out_path, chunk_path.stem)
+        return out_path
+
+    result = _run_marker_cli(chunk_path, output_dir, out_path)
+    _store_in_cache(cache_key, result, chunk_path.stem)
+    return result
+
+
+def _run_marker_cli(chunk_path: Path, output_dir: Path, out_path: Path) -> Path:
+    """Fallback: shell out to the marker_single CLI (model reload per call)."""
+    # If CUDA_VISIBLE_DEVICES is set in env, respect it; otherwise use system default
+    env = os.environ.copy()
+
     # Build command with custom output directory
-    # Filter out any existing --output_dir flags and their arguments
-    filtered_flags = []
-    skip_next = False
-    for i, flag in enumerate(MARKER_FLAGS):
-        if skip_next:
-            skip_next = False
-            continue
-        if flag == "--output_dir":
-            skip_next = True  # Skip the next item (the path argument)
-            continue
-        filtered_flags.append(flag)
-    
-    cmd = [MARKER_CLI, str(chunk_path), "--output_dir", str(output_dir)] + filtered_flags
+    cmd = [MARKER_CLI, str(chunk_path), "--output_dir", str(output_dir), *MARKER_FLAGS_CLEAN]
 
-    logger.info(f"Starting Marker for {chunk_path} with cmd: {' '.join(shlex.quote(p) for p in cmd)}")
+    logger.info("Starting Marker for %s with cmd: %s", chunk_path, ' '.join(shlex.quote(p) for p in cmd))
     start = time.time()
     res = subprocess.run(cmd, capture_output=True, text=True, env=env)
     duration = time.time() - start
@@ -84,91 +274,229 @@ def run_marker_for_chunk(chunk_path: Path, output_dir: Path = None) -> Path:
         # ensure stderr is available in the exception message for immediate feedback
         raise MarkerError(f"Marker failed for {chunk_path}: {res.stderr}")
     
-    # If marker outputs to stdout or writes file elsewhere, try to discover the produced markdown.
-    # First, check the canonical out_path
+    # marker_single writes <output_dir>/<stem>/<stem>.md; treat that layout
+    # as authoritative instead of globbing around for candidates
+    nested_path = output_dir / chunk_path.stem / f"{chunk_path.stem}.md"
+    if nested_path.exists():
+        return nested_path
+
+    # Older marker versions wrote the flat <output_dir>/<stem>.md
     if out_path.exists():
         return out_path
 
-    logger.debug("Expected output not found at canonical path; attempting discovery heuristics.")
-    
-    # Look for the markdown file in the output directory or as a directory with .md file inside
-    candidates = []
-    stem_pattern = f"{chunk_path.stem}*"
+    logger.error(
+        "Marker finished but produced no markdown at %s or %s; stdout/stderr in debug logs",
+        nested_path,
+        out_path,
+    )
+    raise MarkerError(f"Expected markdown output not found after Marker run for {chunk_path}")
 
-    try:
-        candidates.extend(list(output_dir.glob(stem_pattern)))
-    except Exception:
-        logger.debug(f"Could not access output_dir: {output_dir}")
 
-    # Look in the input file's parent (where marker may have placed outputs)
-    try:
-        candidates.extend(list(chunk_path.parent.glob(stem_pattern)))
-    except Exception:
-        pass
+async def run_marker_for_chunk_async(chunk_path: Path, output_dir: Path = None) -> Path:
+    """Async variant of the CLI path: await marker_single as a subprocess.
 
-    # Look in current working directory
-    try:
-        candidates.extend(list(Path.cwd().glob(stem_pattern)))
-    except Exception:
-        pass
+    Lets an async caller run several marker subprocesses concurrently
+    without parking a worker thread per subprocess. Only useful in CLI
+    mode; in-process marker callers should use run_marker_for_chunk.
 
-    # Parse stdout/stderr for any .md path or directory path
-    text = (res.stdout or "") + "\n" + (res.stderr or "")
-    import re
-    
-    # Look for both .md files and directory paths in the output
-    md_paths = re.findall(r"[A-Za-z0-9_:\\/.\- ]+(?:\.md|/[A-Za-z0-9_\- ]+)(?:\s|$)", text)
-    for p in md_paths:
-        p = p.strip()
+    Raises:
+        MarkerError: If marker processing fails
+    """
+    if output_dir is None:
+        output_dir = OUTPUTS_DIR
+
+    out_path = output_dir / f"{chunk_path.stem}.md"
+
+    # wait_for_gpu_ready sleeps between polls; keep that off the event loop
+    await asyncio.to_thread(wait_for_gpu_ready)
+
+    env = os.environ.copy()
+    cmd = [MARKER_CLI, str(chunk_path), "--output_dir", str(output_dir), *MARKER_FLAGS_CLEAN]
+
+    logger.info("Starting Marker for %s with cmd: %s", chunk_path, ' '.join(shlex.quote(p) for p in cmd))
+    start = time.time()
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+    )
+    stdout, stderr = await proc.communicate()
+    duration = time.time() - start
+
+    logger.info("Marker finished for %s (exit=%s) in %.2fs", chunk_path, proc.returncode, duration)
+    logger.debug("Marker stderr for %s:\n%s", chunk_path, stderr.decode(errors="replace") or "<no stderr>")
+
+    if proc.returncode != 0:
+        raise MarkerError(f"Marker failed for {chunk_path}: {stderr.decode(errors='replace')}")
+
+    nested_path = output_dir / chunk_path.stem / f"{chunk_path.stem}.md"
+    if nested_path.exists():
+        return nested_path
+    if out_path.exists():
+        return out_path
+    raise MarkerError(f"Expected markdown output not found after Marker run for {chunk_path}")
+
+
+async def run_marker_for_chunks_async(
+    chunk_paths: List[Path],
+    output_dir: Path = None,
+    max_concurrency: int = None,
+) -> List[Union[Path, MarkerError]]:
+    """Await marker CLI subprocesses for several chunks concurrently.
+
+    Concurrency is bounded by a semaphore (defaults to the pool sizing used
+    by run_marker_for_chunks). Returns the same Path-or-MarkerError list as
+    the synchronous batch API.
+    """
+    if not chunk_paths:
+        return []
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or _MAX_WORKERS))
+
+    async def _run_one(chunk_path: Path) -> Union[Path, MarkerError]:
+        async with semaphore:
+            try:
+                return await run_marker_for_chunk_async(chunk_path, output_dir=output_dir)
+            except MarkerError as e:
+                logger.warning("Marker failed for chunk %s: %s", chunk_path, e)
+                return e
+
+    return list(await asyncio.gather(*(_run_one(p) for p in chunk_paths)))
+
+
+class _MarkerBatcher:
+    """Aggregate queued chunks into batches before dispatching to the pool.
+
+    Producers (one per upload) push chunks onto a shared queue and get a
+    Future back. A single consumer thread drains the queue, firing a batch
+    when it holds MARKER_BATCH_SIZE chunks or MARKER_BATCH_WAIT_MS elapses,
+    whichever comes first. Batching amortizes the GPU readiness check and
+    keeps the resident models busy across pages from concurrent uploads.
+    """
+
+    def __init__(self, batch_size: int = MARKER_BATCH_SIZE, batch_wait_ms: int = MARKER_BATCH_WAIT_MS):
+        self._batch_size = max(1, batch_size)
+        self._batch_wait_s = max(0, batch_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, chunk_path: Path, output_dir: Path) -> "Future":
+        """Queue one chunk and return a Future resolving to its markdown Path."""
+        future = Future()
+        self._queue.put((chunk_path, output_dir, future))
+        self._ensure_worker()
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._drain_loop, name="marker-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _drain_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._batch_wait_s
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process_batch(batch)
+
+    def _process_batch(self, batch):
+        logger.info("Dispatching marker batch of %s chunks", len(batch))
+
+        # Up-front GPU readiness wait so a whole batch fails fast on timeout
         try:
-            pth = Path(p)
-            if pth.exists():
-                candidates.append(pth)
-        except Exception:
-            continue
+            wait_for_gpu_ready()
+        except MarkerError as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        def _run_one(item):
+            chunk_path, output_dir, future = item
+            try:
+                future.set_result(run_marker_for_chunk(chunk_path, output_dir=output_dir))
+            except Exception as e:
+                future.set_exception(e)
+
+        workers = max(1, min(_MAX_WORKERS, len(batch)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_run_one, batch))
+
+
+_BATCHER = _MarkerBatcher()
+
+
+def run_marker_for_chunks(
+    chunk_paths: List[Path],
+    output_dir: Path = None,
+) -> List[Union[Path, MarkerError]]:
+    """Run marker on several chunks through the shared batching queue.
+
+    Chunks from concurrent callers coalesce into the same batches, so the
+    pool and GPU stay saturated without per-caller oversubscription.
+
+    Args:
+        chunk_paths: Input files (images or PDFs) in the order results are wanted
+        output_dir: Directory where marker should save outputs (same for all chunks)
+
+    Returns:
+        List aligned with chunk_paths; each entry is the markdown Path on
+        success or the MarkerError raised for that chunk, so callers can keep
+        partial results from a batch.
+    """
+    if not chunk_paths:
+        return []
 
-    # Deduplicate and sort by modification time (newest first)
-    unique = {}
-    for c in candidates:
+    futures = [_BATCHER.submit(p, output_dir) for p in chunk_paths]
+    results: List[Union[Path, MarkerError]] = []
+    for chunk_path, future in zip(chunk_paths, futures):
         try:
-            unique[str(c.resolve())] = c
-        except Exception:
-            unique[str(c)] = c
-
-    candidates = list(unique.values())
-    candidates.sort(key=lambda p: p.stat().st_mtime if p.exists() else 0, reverse=True)
-
-    if candidates:
-        for chosen in candidates:
-            logger.info(f"Discovered Marker output at {chosen}")
-            
-            # If it's a directory, look for .md file inside (recursively up to 2 levels)
-            if chosen.is_dir():
-                # First look for .md file directly in the directory
-                md_files = list(chosen.glob("*.md"))
-                if md_files:
-                    md_file = md_files[0]
-                    logger.info(f"Found markdown file inside directory: {md_file}")
-                    return md_file
-                
-                # If not found, look one level deeper
-                md_files = list(chosen.glob("*/*.md"))
-                if md_files:
-                    md_file = md_files[0]
-                    logger.info(f"Found markdown file in subdirectory: {md_file}")
-                    return md_file
-            elif chosen.is_file() and chosen.suffix == ".md":
-                return chosen
-
-    # Nothing found
-    logger.error("Marker finished but no markdown output discovered; stdout/stderr below:\n%s", text)
-    raise MarkerError(f"Expected markdown output not found after Marker run for {chunk_path}")
+            results.append(future.result())
+        except MarkerError as e:
+            logger.warning("Marker failed for chunk %s: %s", chunk_path, e)
+            results.append(e)
+        except Exception as e:
+            logger.warning("Marker failed for chunk %s: %s", chunk_path, e)
+            results.append(MarkerError(str(e)))
+    return results
+
+
+# Forking nvidia-smi costs ~50-200ms; serve repeat queries from a short-lived
+# cache so per-chunk GPU checks don't pay it. The TTL stays well under the
+# wait_for_gpu_ready poll interval, so the wait loop still sees fresh data.
+_NVSMI_TTL_SEC = min(2.0, GPU_POLL_INTERVAL_SEC / 2)
+_nvsmi_cache = {"ts": 0.0, "val": []}
 
 
 def _query_nvidia_smi() -> List[Tuple[int, int, int, int]]:
     """Return list of tuples (index, temp_c, mem_total_mb, mem_used_mb) for each GPU.
-    If nvidia-smi is not available or fails, return empty list.
+    If nvidia-smi is not available or fails, return empty list. Results are
+    cached for _NVSMI_TTL_SEC to avoid a subprocess fork per call.
     """
+    now = time.monotonic()
+    if now - _nvsmi_cache["ts"] < _NVSMI_TTL_SEC:
+        return _nvsmi_cache["val"]
+
+    val = _query_nvidia_smi_uncached()
+    _nvsmi_cache["ts"] = now
+    _nvsmi_cache["val"] = val
+    return val
+
+
+def _query_nvidia_smi_uncached() -> List[Tuple[int, int, int, int]]:
     try:
         cmd = [
             "nvidia-smi",
@@ -177,7 +505,7 @@ def _query_nvidia_smi() -> List[Tuple[int, int, int, int]]:
         ]
         res = subprocess.run(cmd, capture_output=True, text=True)
         if res.returncode != 0:
-            logger.debug(f"nvidia-smi returned non-zero: {res.stderr}")
+            logger.debug("nvidia-smi returned non-zero: %s", res.stderr)
             return []
 
         lines = [ln.strip() for ln in res.stdout.splitlines() if ln.strip()]
@@ -195,10 +523,29 @@ def _query_nvidia_smi() -> List[Tuple[int, int, int, int]]:
         logger.debug("nvidia-smi not found; skipping GPU queries")
         return []
     except Exception as e:
-        logger.debug(f"Error querying nvidia-smi: {e}")
+        logger.debug("Error querying nvidia-smi: %s", e)
         return []
 
 
+def _default_max_workers() -> int:
+    """Compute the chunk-pool size: min(cpu_count, GPU_count * slots).
+
+    Honors MARKER_MAX_WORKERS when set. Without GPUs, fall back to a small
+    pool so CPU-only marker runs don't thrash the machine.
+    """
+    if MARKER_MAX_WORKERS > 0:
+        return MARKER_MAX_WORKERS
+    cpu = os.cpu_count() or 1
+    gpus = _query_nvidia_smi()
+    if gpus:
+        return max(1, min(cpu, len(gpus) * MARKER_SLOTS_PER_GPU))
+    return max(1, min(cpu, MARKER_SLOTS_PER_GPU))
+
+
+# Sized once at import so per-batch code doesn't re-query nvidia-smi
+_MAX_WORKERS = _default_max_workers()
+
+
 def _gpu_state_ok() -> bool:
     """Return True if all GPUs are below temp threshold and have sufficient free memory.
     If no GPUs are present or nvidia-smi unavailable, return True (no GPU to wait on).
@@ -210,10 +557,10 @@ def _gpu_state_ok() -> bool:
     for idx, temp, mem_total, mem_used in gpus:
         mem_free = mem_total - mem_used
         if temp >= GPU_TEMP_THRESHOLD_C:
-            logger.debug(f"GPU {idx} temp {temp}C >= threshold {GPU_TEMP_THRESHOLD_C}C")
+            logger.debug("GPU %s temp %sC >= threshold %sC", idx, temp, GPU_TEMP_THRESHOLD_C)
             return False
         if mem_free < GPU_MEM_FREE_MB:
-            logger.debug(f"GPU {idx} free mem {mem_free}MB < required {GPU_MEM_FREE_MB}MB")
+            logger.debug("GPU %s free mem %sMB < required %sMB", idx, mem_free, GPU_MEM_FREE_MB)
             return False
     return True
 
@@ -40,12 +40,12 @@ def _convert_pdf_to_images(pdf_path: Path, output_dir: Path) -> List[Path]:
     output_dir.mkdir(parents=True, exist_ok=True)
     
     try:
-        logger.info(f"Converting PDF to images: {pdf_path}")
+        logger.info("Converting PDF to images: %s", pdf_path)
         
         # Open PDF document
         doc = fitz.open(str(pdf_path))
         page_count = doc.page_count
-        logger.info(f"PDF has {page_count} pages")
+        logger.info("PDF has %s pages", page_count)
         
         image_paths = []
         
@@ -59,53 +59,17 @@ def _convert_pdf_to_images(pdf_path: Path, output_dir: Path) -> List[Path]:
             image_filename = output_dir / f"{pdf_path.stem}_page_{page_num + 1:04d}.png"
             pix.save(str(image_filename))
             image_paths.append(image_filename)
-            logger.debug(f"Saved page {page_num + 1} to {image_filename}")
+            logger.debug("Saved page %s to %s", page_num + 1, image_filename)
         
         doc.close()
-        logger.info(f"Successfully converted {len(image_paths)} pages from PDF")
+        logger.info("Successfully converted %s pages from PDF", len(image_paths))
         return image_paths
     
     except Exception as e:
-        logger.error(f"PDF to image conversion failed: {e}")
+        logger.error("PDF to image conversion failed: %s", e)
         raise MarkerError(f"Failed to convert PDF to images: {str(e)}")
 
 
-def _process_image_with_marker(image_path: Path, output_dir: Path) -> str:
-    """Process single image with marker_single and return extracted markdown content.
-    
-    Args:
-        image_path: Path to image file
-        output_dir: Directory where marker should save outputs
-    
-    Returns:
-        Extracted markdown content as string
-    
-    Raises:
-        MarkerError: If marker processing fails
-    """
-    from .marker_runner import run_marker_for_chunk
-    
-    try:
-        logger.info(f"Processing image with marker_single: {image_path}")
-        output_path = run_marker_for_chunk(image_path, output_dir=output_dir)
-        
-        # Read the markdown output
-        if not output_path.exists():
-            raise MarkerError(f"Marker output not found at {output_path}")
-        
-        with output_path.open("r", encoding="utf-8") as f:
-            content = f.read()
-        
-        logger.debug(f"Extracted {len(content)} characters from {image_path}")
-        return content
-    
-    except MarkerError:
-        raise
-    except Exception as e:
-        logger.error(f"Error processing image {image_path}: {e}")
-        raise MarkerError(f"Failed to process image with marker: {str(e)}")
-
-
 def _combine_markdown_content(
     contents: List[Tuple[Path, str]],
     original_filename: str
@@ -150,10 +114,10 @@ def _save_combined_markdown(content: str, output_path: Path) -> Path:
         output_path.parent.mkdir(parents=True, exist_ok=True)
         with output_path.open("w", encoding="utf-8") as f:
             f.write(content)
-        logger.info(f"Saved combined markdown to {output_path}")
+        logger.info("Saved combined markdown to %s", output_path)
         return output_path
     except Exception as e:
-        logger.error(f"Failed to save markdown output: {e}")
+        logger.error("Failed to save markdown output: %s", e)
         raise MarkerError(f"Failed to save combined markdown: {str(e)}")
 
 
@@ -172,9 +136,9 @@ def _cleanup_temp_images(image_paths: List[Path], keep_images: bool = False):
         try:
             if image_path.exists():
                 image_path.unlink()
-                logger.debug(f"Deleted temporary image: {image_path}")
+                logger.debug("Deleted temporary image: %s", image_path)
         except Exception as e:
-            logger.warning(f"Failed to delete temporary image {image_path}: {e}")
+            logger.warning("Failed to delete temporary image %s: %s", image_path, e)
 
 
 def convert_pdf_and_process(
@@ -221,33 +185,40 @@ def convert_pdf_and_process(
     
     try:
         # Step 1: Convert PDF to images
-        logger.info(f"Starting PDF conversion workflow for {pdf_path}")
+        logger.info("Starting PDF conversion workflow for %s", pdf_path)
         image_paths = _convert_pdf_to_images(pdf_path, temp_image_dir)
         
         if not image_paths:
             raise MarkerError(f"No images extracted from PDF {pdf_path}")
         
-        logger.info(f"Extracted {len(image_paths)} images from PDF")
+        logger.info("Extracted %s images from PDF", len(image_paths))
         
-        # Step 2: Process each image with marker_single (sequentially)
+        # Step 2: Process the images with marker_single in parallel
         logger.info("Processing extracted images with marker_single")
         contents: List[Tuple[Path, str]] = []
-        
+
         # Ensure document output directory exists before processing
         doc_output_dir.mkdir(parents=True, exist_ok=True)
-        
-        for idx, image_path in enumerate(image_paths, 1):
-            logger.info(f"Processing image {idx}/{len(image_paths)}: {image_path.name}")
+
+        from .marker_runner import run_marker_for_chunks
+        results = run_marker_for_chunks(image_paths, output_dir=doc_output_dir)
+        for image_path, result in zip(image_paths, results):
+            if isinstance(result, MarkerError):
+                logger.warning("Failed to process image %s: %s", image_path, result)
+                # Continue with remaining images instead of failing completely
+                contents.append((image_path, f"*Failed to extract content from this page: {str(result)}*\n"))
+                continue
             try:
-                markdown_content = _process_image_with_marker(image_path, output_dir=doc_output_dir)
+                # One-shot read + decode; skips TextIOWrapper's incremental
+                # decoding and newline translation on each page file
+                markdown_content = result.read_bytes().decode("utf-8", errors="replace")
                 contents.append((image_path, markdown_content))
-            except MarkerError as e:
-                logger.warning(f"Failed to process image {image_path}: {e}")
-                # Continue with remaining images instead of failing completely
+            except Exception as e:
+                logger.warning("Could not read marker output %s: %s", result, e)
                 contents.append((image_path, f"*Failed to extract content from this page: {str(e)}*\n"))
         
         # Step 3: Combine all extracted content
-        logger.info(f"Combining content from {len(contents)} processed images")
+        logger.info("Combining content from %s processed images", len(contents))
         combined_content = _combine_markdown_content(contents, pdf_path.name)
         
         # Step 4: Save combined markdown inside document folder
@@ -257,7 +228,7 @@ def convert_pdf_and_process(
         # Step 5: Cleanup temporary images (if not keeping)
         _cleanup_temp_images(image_paths, keep_images=keep_images)
         
-        logger.info(f"PDF conversion workflow completed successfully. Output: {final_path}")
+        logger.info("PDF conversion workflow completed successfully. Output: %s", final_path)
         return final_path
     
     except MarkerError:
@@ -266,6 +237,6 @@ def convert_pdf_and_process(
         raise
     except Exception as e:
         # Cleanup on unexpected error
-        logger.error(f"Unexpected error in PDF conversion workflow: {e}")
+        logger.error("Unexpected error in PDF conversion workflow: %s", e)
         _cleanup_temp_images(image_paths, keep_images=False)
         raise MarkerError(f"PDF conversion workflow failed: {str(e)}")
@@ -1,9 +1,24 @@
+import mmap
+import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from pathlib import Path
 from typing import List, Tuple, Optional
+import numpy as np
 import pandas as pd
 import logging
 
+# Optional fast path: pyarrow's multithreaded SIMD CSV tokenizer
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+    _HAVE_ARROW = True
+except ImportError:
+    _HAVE_ARROW = False
+
 # Fallback logger if not using your package
 def get_logger(name: str):
     logger = logging.getLogger(name)
@@ -19,87 +34,354 @@ def get_logger(name: str):
 
 logger = get_logger(__name__)
 
+# Parsed tables per document, LRU-evicted; keyed on (path, mtime_ns, size)
+# so a rewritten file misses even when the mtime granularity is coarse
+_TABLE_CACHE_MAX = 32
+_table_cache: "OrderedDict[Tuple[str, int, int], Tuple[pd.DataFrame, ...]]" = OrderedDict()
+_table_cache_lock = threading.Lock()
+
+
 def extract_tables_as_dataframes(markdown_path: Path) -> List[pd.DataFrame]:
-    """Extract all markdown tables from a file into a list of DataFrames."""
-    content = markdown_path.read_text(encoding="utf-8")
-    
-    # Regex to match lines starting with | and ending with |
-    table_pattern = r"^\|(.+)\|$"
-    lines = content.split("\n")
-    
-    tables: List[pd.DataFrame] = []
-    current_table_lines: List[str] = []
-    in_table = False
-    
-    for line in lines:
-        if re.match(table_pattern, line.strip()):
-            in_table = True
-            current_table_lines.append(line)
-        elif in_table and line.strip():
-            if not re.match(table_pattern, line.strip()):
-                # End of table
-                if current_table_lines:
-                    df = _parse_markdown_table(current_table_lines)
-                    if df is not None and len(df) > 0:
-                        tables.append(df)
-                current_table_lines = []
-                in_table = False
-        elif in_table and not line.strip():
-            # Empty line might still be in table
-            pass
-    
-    # Add last table if file ends with a table
-    if current_table_lines:
-        df = _parse_markdown_table(current_table_lines)
-        if df is not None and len(df) > 0:
-            tables.append(df)
-    
-    return tables
+    """Extract all markdown tables from a file into a list of DataFrames.
+
+    Results are memoized per document, so repeated requests for the same
+    unchanged file (common in UI filter workflows) skip the re-parse. One
+    stat() call covers both the existence check and the cache key, and
+    callers get shallow DataFrame copies — column buffers are shared, but
+    renames or column drops downstream can't corrupt the cached entry.
+    """
+    st = markdown_path.stat()
+    key = (str(markdown_path), st.st_mtime_ns, st.st_size)
+
+    with _table_cache_lock:
+        cached = _table_cache.get(key)
+        if cached is not None:
+            _table_cache.move_to_end(key)
+
+    if cached is None:
+        cached = tuple(_extract_tables(markdown_path))
+        with _table_cache_lock:
+            _table_cache[key] = cached
+            _table_cache.move_to_end(key)
+            while len(_table_cache) > _TABLE_CACHE_MAX:
+                _table_cache.popitem(last=False)
+
+    return [df.copy(deep=False) for df in cached]
+
+
+def clear_table_cache():
+    """Drop memoized tables; call when an upload overwrites a document's output."""
+    with _table_cache_lock:
+        _table_cache.clear()
+
+
+# Markdown header/body separator rows like | --- | :--- |, plus blank lines;
+# one multiline sub removes them all in a single scan of the block. Bytes
+# patterns, so blocks stay undecoded until parse time
+SEPARATOR_SUB_REGEX = re.compile(rb"(?m)^\s*\|?\s*:?-{3,}[^\n]*\n?|^[ \t]*\n")
+# Leading/trailing pipes on each line, removed block-wide in one pass
+EDGE_PIPES_REGEX = re.compile(rb"(?m)^[ \t]*\||\|[ \t]*$")
+
+# Bound once so the per-table hot path skips the attribute lookups
+_strip_separators = SEPARATOR_SUB_REGEX.sub
+_strip_edge_pipes = EDGE_PIPES_REGEX.sub
+
+# Below this many tables the pool setup cost outweighs the win
+_PARALLEL_PARSE_THRESHOLD = 4
+
+# A table line may sit behind up to three spaces/tabs of indentation;
+# four or more means a markdown code block, not a table. Shared by the
+# numpy scan and the streaming fallback so both classify lines identically
+_MAX_TABLE_INDENT = 3
+
+
+def _iter_table_blocks(markdown_path: Path):
+    """Yield table blocks as bytes by scanning the file through mmap.
+
+    The OS pages the file in on demand and blocks stay undecoded until the
+    parser has dropped separator rows and edge pipes, so large marker
+    outputs never get duplicated as a full str. bytes.splitlines-level
+    operations downstream also skip per-character unicode classification.
+    """
+    with markdown_path.open("rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and mmap-less filesystems (some FUSE/network
+            # mounts) fall back to streaming the lines through a tiny
+            # state machine — no regex, no full-file buffer
+            yield from _iter_table_blocks_streaming(markdown_path)
+            return
+        with mm:
+            for start, end in _split_table_spans(mm):
+                yield mm[start:end]
+
+
+def _split_table_spans(buf) -> List[Tuple[int, int]]:
+    """Return (start, end) byte offsets of each table block in *buf*.
+
+    The signature mirrors a drop-in native tokenizer
+    (``split_tables(buf, len) -> list[(start, end)]``), so the scan can be
+    swapped for a compiled single-pass implementation without touching the
+    callers; offsets rather than copies keep the slicing with the caller,
+    which holds the mmap.
+
+    The scan is pure byte work — find newlines, test each line's first
+    byte — so it runs through numpy's vectorized comparisons (SIMD on most
+    builds) rather than the backtracking regex engine, one whole-buffer
+    pass per step at memory bandwidth.
+    """
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    if arr.size == 0:
+        return []
+
+    nl = np.flatnonzero(arr == 0x0A)
+    line_starts = np.concatenate(([0], nl + 1))
+    if line_starts[-1] >= arr.size:
+        # Trailing newline: no phantom empty line at EOF
+        line_starts = line_starts[:-1]
+    # End of each line, exclusive of its newline; a final unterminated
+    # line ends at the buffer end
+    line_ends = np.concatenate((nl, [arr.size]))[: line_starts.size]
+
+    # Classify each line by its first byte after at most _MAX_TABLE_INDENT
+    # leading spaces/tabs; the probe advances one whitespace column per
+    # vectorized step while spans keep the original line starts
+    is_ws = (arr == 0x20) | (arr == 0x09)
+    first = line_starts
+    for _ in range(_MAX_TABLE_INDENT):
+        adv = (first < line_ends) & is_ws[np.minimum(first, arr.size - 1)]
+        if not adv.any():
+            break
+        first = first + adv
+    is_table = (first < line_ends) & (arr[np.minimum(first, arr.size - 1)] == 0x7C)  # ord('|')
+    t_starts = line_starts[is_table]
+    t_ends = line_ends[is_table]
+    if t_starts.size == 0:
+        return []
+
+    # Coalesce runs of consecutive |-lines: a block continues while the
+    # next table line starts right after the previous line's newline
+    breaks = np.flatnonzero(t_starts[1:] != t_ends[:-1] + 1)
+    span_starts = t_starts[np.concatenate(([0], breaks + 1))]
+    span_ends = t_ends[np.concatenate((breaks, [t_ends.size - 1]))]
+    return list(zip(span_starts.tolist(), span_ends.tolist()))
+
+
+def _iter_table_blocks_streaming(markdown_path: Path):
+    """One-pass line iterator: a cheap prefix test toggles table collection.
+
+    Memory stays bounded by the largest single table instead of the file.
+    """
+    buf: List[bytes] = []
+    with markdown_path.open("rb") as f:
+        for line in f:
+            # Same classification as _split_table_spans: a pipe within the
+            # first _MAX_TABLE_INDENT columns of whitespace
+            stripped = line.lstrip(b" \t")
+            if stripped[:1] == b"|" and len(line) - len(stripped) <= _MAX_TABLE_INDENT:
+                buf.append(line)
+            elif buf:
+                yield b"".join(buf)
+                buf.clear()
+    if buf:
+        yield b"".join(buf)
+
+
+def _extract_tables(markdown_path: Path) -> List[pd.DataFrame]:
+    tables_md = list(_iter_table_blocks(markdown_path))
+
+    if len(tables_md) >= _PARALLEL_PARSE_THRESHOLD:
+        # Table blocks parse independently; the C tokenizer releases the GIL,
+        # so threads overlap the work without pickling blocks and DataFrames
+        # back and forth the way a process pool does
+        workers = min(os.cpu_count() or 1, len(tables_md))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parsed = list(executor.map(_parse_markdown_table, tables_md))
+    else:
+        parsed = [_parse_markdown_table(table_md) for table_md in tables_md]
+
+    dropped = sum(1 for df in parsed if df is None)
+    if dropped:
+        logger.warning("Skipped %d unparsable table blocks in %s", dropped, markdown_path)
+    return [df for df in parsed if df is not None and len(df) > 0]
+
+
+def _read_table_block(cleaned_bytes: bytes) -> pd.DataFrame:
+    """Parse one pipe-delimited block, preferring pyarrow's vectorized tokenizer."""
+    if _HAVE_ARROW:
+        try:
+            # Pin every column to string and disable null detection so the
+            # arrow path matches the pandas fallback's dtype=str +
+            # na_filter=False exactly — otherwise "007" becomes 7, "NA"
+            # becomes NaN, and all-empty columns dodge the prune
+            header_names = [
+                cell.decode("utf-8", errors="replace")
+                for cell in cleaned_bytes.split(b"\n", 1)[0].split(b"|")
+            ]
+            table = pacsv.read_csv(
+                pa.py_buffer(cleaned_bytes),
+                parse_options=pacsv.ParseOptions(delimiter="|"),
+                convert_options=pacsv.ConvertOptions(
+                    column_types={name: pa.string() for name in header_names},
+                    null_values=[],
+                ),
+            )
+            # split_blocks + self_destruct let the conversion reuse arrow
+            # buffers instead of copying the whole table a second time
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+        except Exception as e:
+            logger.debug("pyarrow CSV parse failed, falling back to pandas: %s", e)
 
+    # dtype=str + na_filter=False skip type inference and the NA scan; all
+    # downstream normalization assumes plain strings anyway. The C engine
+    # decodes utf-8 internally, so handing it bytes skips the extra
+    # str round-trip a StringIO would force. index_col=False stops a row
+    # with a stray extra pipe from being read as an implied index (which
+    # would shift every column); on_bad_lines="skip" drops just that
+    # ragged row instead of failing the whole table
+    return pd.read_csv(
+        BytesIO(cleaned_bytes),
+        sep="|",
+        engine="c",
+        skipinitialspace=True,
+        dtype=str,
+        na_filter=False,
+        skip_blank_lines=True,
+        encoding_errors="replace",
+        index_col=False,
+        on_bad_lines="skip",
+    )
 
-def _parse_markdown_table(lines: List[str]) -> Optional[pd.DataFrame]:
-    """Parse markdown table lines into a pandas DataFrame."""
-    if len(lines) < 2:
+
+def _parse_markdown_table(table_md: bytes) -> Optional[pd.DataFrame]:
+    """Parse one markdown table block (raw bytes) into a pandas DataFrame."""
+    # Separator rows always carry at least three dashes, so a memchr-class
+    # containment test rejects separator-free blocks in one scan without
+    # ever engaging the regex engine
+    if b"---" in table_md:
+        table_md = _strip_separators(b"", table_md)
+
+    # Strip the edge pipes so sep='|' yields no empty edge columns and the
+    # fast C tokenizer stays in play
+    cleaned = _strip_edge_pipes(b"", table_md).strip()
+
+    # Need a header line plus at least one data row
+    if cleaned.count(b"\n") < 1:
         return None
-    
-    # Header
-    header_line = lines[0]
-    headers = [h.strip() for h in header_line.split("|")[1:-1]]
-    
-    # Skip separator (usually second line) and read data
-    data_rows: List[List[str]] = []
-    for line in lines[2:]:
-        if not line.strip():
-            continue
-        cells = [c.strip() for c in line.split("|")[1:-1]]
-        if len(cells) == len(headers):
-            data_rows.append(cells)
-    
-    if not data_rows:
+
+    try:
+        # Bytes all the way into the tokenizer; both parsers decode utf-8
+        # themselves, so nothing is materialized as a Python str first
+        df = _read_table_block(cleaned)
+    except Exception as e:
+        # Summarized by the caller; per-block detail only at debug level
+        logger.debug("Failed to parse a table chunk: %s", e)
         return None
-    
-    df = pd.DataFrame(data_rows, columns=headers)
+
+    # In-place label strip; avoids materializing a renamed copy of the frame
+    df.rename(columns=lambda c: c.strip() if isinstance(c, str) else c, inplace=True)
+
+    # Strip cells column-at-a-time so pandas dispatches to its C string
+    # routines instead of calling a Python lambda per cell; assigning each
+    # column back directly avoids building an intermediate sub-frame
+    for col in df.select_dtypes(include="object").columns:
+        df[col] = df[col].str.strip()
+
+    # With na_filter=False empty cells arrive as "" rather than NaN, so a
+    # dropna-style prune never fires; one vectorized mask drops columns
+    # that are all-empty or headerless (pandas labels those "Unnamed: N")
+    # — the usual residue of padding pipes
+    cols = df.columns.astype(str)
+    headerless = np.asarray((cols == "") | cols.str.startswith("Unnamed:"))
+    keep = (df != "").any(axis=0).to_numpy() & ~headerless
+    if not keep.all():
+        df = df.loc[:, keep]
     return df
 
 
+def _write_csv(df: pd.DataFrame, csv_path: Path):
+    """Write one table, preferring pyarrow's vectorized CSV formatter."""
+    if _HAVE_ARROW:
+        try:
+            pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), str(csv_path))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Created CSV file: %s", csv_path)
+            return
+        except Exception as e:
+            logger.debug("pyarrow CSV write failed for %s, falling back to pandas: %s", csv_path, e)
+
+    df.to_csv(csv_path, index=False, encoding="utf-8")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Created CSV file: %s", csv_path)
+
+
 def save_tables_as_csv(
     dfs: List[pd.DataFrame],
     md_file_path: Path,
     output_dir: Path,
 ) -> List[Path]:
-    """Save each DataFrame as a separate CSV file."""
+    """Save each DataFrame as a separate CSV file.
+
+    Writes run on a thread pool: the work is I/O-bound and the C formatters
+    release the GIL, so N tables no longer pay N sequential format+write
+    stalls.
+    """
     output_dir.mkdir(parents=True, exist_ok=True)
     created: List[Path] = []
-    
+
     if not dfs:
         logger.info("No tables to save; skipping CSV generation.")
         return created
 
-    for idx, df in enumerate(dfs, start=1):
-        csv_path = output_dir / f"table_{idx}.csv"
-        df.to_csv(csv_path, index=False, encoding="utf-8")
-        created.append(csv_path)
-        logger.info(f"Created CSV file: {csv_path}")
+    created = [output_dir / f"table_{idx}.csv" for idx in range(1, len(dfs) + 1)]
+    workers = min(os.cpu_count() or 1, len(dfs))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_write_csv, dfs, created))
+    # One summary line instead of a log-lock acquisition per file
+    logger.info("Created %d CSV files under %s", len(created), output_dir)
+    return created
+
+
+def save_tables_as_xlsx_streaming(
+    dfs: List[pd.DataFrame],
+    out_path: Path,
+    sheets_per_file: int = 32,
+) -> List[Path]:
+    """Write tables into xlsx workbooks using openpyxl's write-only mode.
+
+    Write-only workbooks stream rows out as they are appended instead of
+    buffering every cell in memory, which matters for large table sets.
+    Rotates to a numbered workbook every `sheets_per_file` sheets.
+    Returns the created file paths.
+    """
+    import openpyxl
+
+    created: List[Path] = []
+    if not dfs:
+        logger.info("No tables to save; skipping XLSX generation.")
+        return created
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    for part_start in range(0, len(dfs), sheets_per_file):
+        part_dfs = dfs[part_start:part_start + sheets_per_file]
+        if len(dfs) > sheets_per_file:
+            part_num = part_start // sheets_per_file + 1
+            path = out_path.with_name(f"{out_path.stem}_{part_num}{out_path.suffix}")
+        else:
+            path = out_path
+
+        wb = openpyxl.Workbook(write_only=True)
+        for offset, df in enumerate(part_dfs):
+            ws = wb.create_sheet(title=f"table_{part_start + offset + 1}")
+            ws.append(list(df.columns))
+            for row in df.itertuples(index=False, name=None):
+                ws.append(row)
+        wb.save(path)
+        created.append(path)
+        logger.info("Created XLSX file: %s", path)
+
     return created
 
 
@@ -109,25 +391,39 @@ def extract_and_save_tables(
     csv_base_dir: Optional[Path] = None,
 ) -> Tuple[Path, List[pd.DataFrame], List[Path], Path]:
     """Extract tables from markdown and save them as CSVs."""
-    possible_paths = [
-        outputs_dir / document_name / f"{document_name}.md",
-        outputs_dir / document_name / document_name / f"{document_name}.md",
-        outputs_dir / f"{document_name}.md",
-    ]
-    
-    md_path: Optional[Path] = None
-    for path in possible_paths:
-        if path.exists():
-            md_path = path
+    doc_dir = outputs_dir / document_name
+    md_name = f"{document_name}.md"
+
+    # One scandir reveals the document folder's layout in a single kernel
+    # call instead of stat'ing each candidate path separately
+    try:
+        entries = {entry.name: entry for entry in os.scandir(doc_dir)}
+    except FileNotFoundError:
+        entries = {}
+
+    candidates: List[Path] = []
+    if md_name in entries:
+        candidates.append(doc_dir / md_name)
+    if document_name in entries and entries[document_name].is_dir():
+        # Image uploads nest one level deeper: <doc>/<doc>/<doc>.md
+        candidates.append(doc_dir / document_name / md_name)
+    # Legacy flat layout
+    candidates.append(outputs_dir / md_name)
+
+    # No exists() pre-probe: extract_tables_as_dataframes stats the path
+    # anyway for its cache key, so that one stat doubles as the existence
+    # check and a missing candidate just moves on to the next
+    for md_path in candidates:
+        try:
+            dfs = extract_tables_as_dataframes(md_path)
             break
-    
-    if md_path is None:
+        except FileNotFoundError:
+            continue
+    else:
         raise FileNotFoundError(
             f"Processed markdown not found for document '{document_name}'. "
-            f"Searched paths: {possible_paths}"
+            f"Searched under {doc_dir} and {outputs_dir}"
         )
-
-    dfs = extract_tables_as_dataframes(md_path)
     
     csv_folder = csv_base_dir / document_name if csv_base_dir else outputs_dir / document_name / f"tables_csv_{document_name}"
     csv_files = save_tables_as_csv(dfs, md_path, csv_folder)